@@ -1,23 +1,23 @@
 import operator
 
-from rpython.rlib.rarithmetic import intmask
-from rpython.rlib.rbigint     import rbigint, _store_digit, NULLDIGIT, NULLRBIGINT, SHIFT, BASE8, BASE16
+from rpython.rlib import jit
+from rpython.rlib.rbigint     import rbigint, NULLRBIGINT, SHIFT, BASE8, BASE16
 from rpython.tool.sourcetools import func_renamer, func_with_new_name
 
 from pypy.module.mamba.smallbits import W_AbstractBits, W_SmallBits, \
-                                        cmp_opp, _get_index, _get_slice_range
+                                        cmp_opp, _get_index, _get_slice_range, _hash_bits
 
 from pypy.interpreter.baseobjspace import W_Root
 from pypy.interpreter.gateway import WrappedDefault, interp2app, interpindirect2app, unwrap_spec
 from pypy.interpreter.error import OperationError, oefmt
-from pypy.objspace.std.intobject import W_IntObject, wrapint, ovfcheck, _hash_int
+from pypy.objspace.std.intobject import W_IntObject, wrapint, ovfcheck
 from pypy.objspace.std.longobject import W_LongObject, newlong, _hash_long
 from pypy.objspace.std.sliceobject import W_SliceObject
 from pypy.objspace.std.util import COMMUTATIVE_OPS
 
-from pypy.module.mamba.helper_funcs import BASE2, get_int_mask, get_long_mask, get_int_lower, get_long_lower, \
+from pypy.module.mamba.helper_funcs import BASE2, get_int_mask, get_long_mask, get_int_lower, get_long_lower, get_long_pow2, \
   _rbigint_check_exceed_nbits, _rbigint_invalid_binop_operand, _rbigint_maskoff_high, \
-  _rbigint_rshift, _rbigint_rshift_maskoff, _rbigint_rshift_maskoff_retint, _rbigint_getidx, \
+  _rbigint_rshift, _rbigint_rshift_int, _rbigint_rshift_maskoff, _rbigint_rshift_maskoff_retint, _rbigint_getidx, \
   _rbigint_setidx, _rbigint_lshift_maskoff, setitem_long_long_helper, setitem_long_int_helper
 
 # NOTE that we should keep self.value positive after any computation:
@@ -42,9 +42,10 @@ class W_BigBits(W_AbstractBits):
   #-----------------------------------------------------------------------
 
   def descr_getitem(self, space, w_index):
+    nbits = jit.promote( self.nbits )
     if type(w_index) is W_SliceObject:
       if space.is_w(w_index.w_step, space.w_None):
-        start, stop = _get_slice_range( space, self.nbits, w_index.w_start, w_index.w_stop )
+        start, stop = _get_slice_range( space, nbits, w_index.w_start, w_index.w_stop )
 
         slice_nbits = stop - start
         if slice_nbits <= SHIFT:
@@ -54,13 +55,14 @@ class W_BigBits(W_AbstractBits):
       else:
         raise oefmt(space.w_IndexError, "Index cannot contain step" )
     else:
-      index = _get_index(space, self.nbits, w_index)
+      index = _get_index(space, nbits, w_index)
       return W_SmallBits( 1, _rbigint_getidx( self.bigval, index ) )
 
   def descr_setitem(self, space, w_index, w_other):
+    nbits = jit.promote( self.nbits )
     if type(w_index) is W_SliceObject:
       if space.is_w(w_index.w_step, space.w_None):
-        start, stop = _get_slice_range( space, self.nbits, w_index.w_start, w_index.w_stop )
+        start, stop = _get_slice_range( space, nbits, w_index.w_start, w_index.w_stop )
         slice_nbits = stop - start
 
         if isinstance(w_other, W_SmallBits):
@@ -76,13 +78,15 @@ class W_BigBits(W_AbstractBits):
 
         elif isinstance(w_other, W_IntObject):
           other = w_other.intval
-          up = get_int_mask(slice_nbits)
-          lo = get_int_lower(slice_nbits)
 
-          if other < lo or other > up:
+          # other fits iff 0 <= other < 2**n or -2**(n-1) <= other < 0.
+          # Any int fits in a slice wider than SHIFT.
+          if slice_nbits <= SHIFT and (other >> slice_nbits) != 0 and \
+                                      (~other >> (slice_nbits-1)) != 0:
             raise oefmt(space.w_ValueError, "Cannot fit value %s into a Bits%d slice!\n"
                                             "(Bits%d only accepts %s <= value <= %s)",
-                                            hex(other), slice_nbits, slice_nbits, hex(lo), hex(up))
+                                            hex(other), slice_nbits, slice_nbits,
+                                            hex(get_int_lower(slice_nbits)), hex(get_int_mask(slice_nbits)))
           if slice_nbits < SHIFT:
             other = other & get_int_mask(slice_nbits)
             self.bigval = setitem_long_int_helper( self.bigval, other, start, stop )
@@ -120,7 +124,7 @@ class W_BigBits(W_AbstractBits):
         raise oefmt(space.w_IndexError, "Index cannot contain step" )
 
     else:
-      index = _get_index(space, self.nbits, w_index)
+      index = _get_index(space, nbits, w_index)
 
       # Check value bitlen. No need to check Bits, but check int/long.
       if isinstance(w_other, W_SmallBits):
@@ -163,22 +167,22 @@ class W_BigBits(W_AbstractBits):
     @func_renamer('descr_' + opname)
     def descr_cmp(self, space, w_other):
       x = self.bigval
+      nbits = jit.promote( self.nbits )
 
       if isinstance(w_other, W_BigBits):
-        if self.nbits != w_other.nbits:
+        if nbits != w_other.nbits:
           raise oefmt(space.w_ValueError, "Operands of '%s' operation must have matching bitwidth, "
-                                          "but here Bits%d != Bits%d.\n", opname, self.nbits, w_other.nbits )
+                                          "but here Bits%d != Bits%d.\n", opname, nbits, w_other.nbits )
         return W_SmallBits( 1, llop( x, w_other.bigval ) )
 
       elif isinstance(w_other, W_SmallBits):
         raise oefmt(space.w_ValueError, "Operands of '%s' operation must have matching bitwidth, "
-                                        "but here Bits%d != Bits%d.\n", opname, self.nbits, w_other.nbits )
+                                        "but here Bits%d != Bits%d.\n", opname, nbits, w_other.nbits )
 
       elif isinstance(w_other, W_IntObject): # int MUST fit Bits64+
-        return W_SmallBits( 1, llop( x, get_long_mask(self.nbits).int_and_( w_other.intval ) ) )
+        return W_SmallBits( 1, llop( x, get_long_mask(nbits).int_and_( w_other.intval ) ) )
 
       elif type(w_other) is W_LongObject:
-        nbits = self.nbits
         y = w_other.num
 
         if _rbigint_invalid_binop_operand( y, nbits ):
@@ -186,7 +190,8 @@ class W_BigBits(W_AbstractBits):
                                           "Suggestion: 0 <= x <= %s", y.format(BASE16, prefix='0x'), nbits,
                                           get_long_mask(nbits).format(BASE16, prefix='0x'))
 
-        return W_SmallBits( 1, llop( x, get_long_mask(nbits).and_( w_other.num ) ) )
+        # y is already known to be in [0, 2**nbits), no need to mask it
+        return W_SmallBits( 1, llop( x, y ) )
 
       if opname == 'eq':
         # Match cpython behavior
@@ -220,66 +225,42 @@ class W_BigBits(W_AbstractBits):
 
     @func_renamer('descr_' + opname)
     def descr_binop(self, space, w_other):
-      # add, sub, mul
       x = self.bigval
-      nbits = self.nbits
+      nbits = jit.promote( self.nbits )
 
-      if ovf:
-        if isinstance(w_other, W_BigBits):
-          if nbits != w_other.nbits:
-            raise oefmt(space.w_ValueError, "Operands of '%s' operation must have matching bitwidth, "
-                                            "but here Bits%d != Bits%d.\n", opname, nbits, w_other.nbits )
-          z = llop( x, w_other.bigval )
-          if opname == "sub": z = z.and_( get_long_mask(nbits) )
-          else:               z = _rbigint_maskoff_high( z, nbits )
-          return W_BigBits( nbits, z )
-
-        elif isinstance(w_other, W_IntObject): # int MUST fit Bits64+
-          z = liop( x, w_other.intval )
-          if opname == "sub": z = z.and_( get_long_mask(nbits) )
-          else:               z = _rbigint_maskoff_high( z, nbits )
-          return W_BigBits( nbits, z )
-
-        elif isinstance(w_other, W_LongObject):
-          y = w_other.num
-          if _rbigint_invalid_binop_operand( y, nbits ):
-            raise oefmt(space.w_ValueError, "Integer %s is not a valid binop operand with Bits%d!\n"
-                                            "Suggestion: 0 <= x <= %s", y.format(BASE16, prefix='0x'), nbits,
-                                            get_long_mask(nbits).format(BASE16, prefix='0x'))
-
-          z = llop( x, y )
-          if opname == "sub": z = z.and_( get_long_mask(nbits) )
-          else:               z = _rbigint_maskoff_high( z, nbits )
-          return W_BigBits( nbits, z )
-
-        elif isinstance(w_other, W_SmallBits):
+      # Each branch only unwraps/validates the operand, the arithmetic
+      # and the final masking are shared below
+      if isinstance(w_other, W_BigBits):
+        if nbits != w_other.nbits:
           raise oefmt(space.w_ValueError, "Operands of '%s' operation must have matching bitwidth, "
                                           "but here Bits%d != Bits%d.\n", opname, nbits, w_other.nbits )
+        z = llop( x, w_other.bigval )
 
-      # and, or, xor, no overflow
-      # opname should be in COMMUTATIVE_OPS
+      elif isinstance(w_other, W_IntObject): # int MUST fit Bits64+
+        z = liop( x, w_other.intval )
+
+      elif isinstance(w_other, W_LongObject):
+        y = w_other.num
+        if _rbigint_invalid_binop_operand( y, nbits ):
+          raise oefmt(space.w_ValueError, "Integer %s is not a valid binop operand with Bits%d!\n"
+                                          "Suggestion: 0 <= x <= %s", y.format(BASE16, prefix='0x'), nbits,
+                                          get_long_mask(nbits).format(BASE16, prefix='0x'))
+        z = llop( x, y )
+
+      elif isinstance(w_other, W_SmallBits):
+        raise oefmt(space.w_ValueError, "Operands of '%s' operation must have matching bitwidth, "
+                                        "but here Bits%d != Bits%d.\n", opname, nbits, w_other.nbits )
       else:
-        if   isinstance(w_other, W_BigBits):
-          if nbits != w_other.nbits:
-            raise oefmt(space.w_ValueError, "Operands of '%s' operation must have matching bitwidth, "
-                                            "but here Bits%d != Bits%d.\n", opname, nbits, w_other.nbits )
-          return W_BigBits( nbits, llop( x, w_other.bigval ) )
+        raise oefmt(space.w_TypeError, "Please do %s between Bits and Bits/int/long objects", opname)
 
-        elif isinstance(w_other, W_IntObject): # int MUST fit Bits64+
-          return W_BigBits( nbits, liop( x, w_other.intval ) )
+      # add, sub, mul
+      if ovf:
+        if opname == "sub": z = z.and_( get_long_mask(nbits) )
+        else:               z = _rbigint_maskoff_high( z, nbits )
 
-        elif isinstance(w_other, W_LongObject):
-          y = w_other.num
-          if _rbigint_invalid_binop_operand( y, nbits ):
-            raise oefmt(space.w_ValueError, "Integer %s is not a valid binop operand with Bits%d!\n"
-                                            "Suggestion: 0 <= x <= %s", y.format(BASE16, prefix='0x'), nbits,
-                                            get_long_mask(nbits).format(BASE16, prefix='0x'))
-          return W_BigBits( nbits, llop( x, y ) )
-
-        elif isinstance(w_other, W_SmallBits):
-          raise oefmt(space.w_ValueError, "Operands of '%s' operation must have matching bitwidth, "
-                                          "but here Bits%d != Bits%d.\n", opname, nbits, w_other.nbits )
-      raise oefmt(space.w_TypeError, "Please do %s between Bits and Bits/int/long objects", opname)
+      # and, or, xor, no overflow
+      # opname should be in COMMUTATIVE_OPS
+      return W_BigBits( nbits, z )
 
     if opname in COMMUTATIVE_OPS:
       @func_renamer('descr_r' + opname)
@@ -300,7 +281,7 @@ class W_BigBits(W_AbstractBits):
     @func_renamer('descr_r' + opname)
     def descr_rbinop(self, space, w_other):
       y = self.bigval
-      nbits = self.nbits
+      nbits = jit.promote( self.nbits )
 
       if isinstance(w_other, W_IntObject):  # int MUST fit Bits64+
         z = llop( rbigint.fromint(w_other.intval), y )
@@ -333,70 +314,72 @@ class W_BigBits(W_AbstractBits):
 
   def descr_rshift(self, space, w_other):
 
+    nbits = jit.promote( self.nbits )
     x = self.bigval
 
     if isinstance(w_other, W_IntObject):
       shamt = w_other.intval
       if shamt < 0: # int must be in bigbits range
         raise oefmt(space.w_ValueError, "Integer %s is not a valid binop operand with Bits%d!\n"
-                                        "Suggestion: 0 <= x <= %s", hex(shamt), self.nbits,
-                                        get_long_mask(self.nbits).format(BASE16, prefix='0x'))
-      return W_BigBits( self.nbits, x.rshift( shamt ) )
+                                        "Suggestion: 0 <= x <= %s", hex(shamt), nbits,
+                                        get_long_mask(nbits).format(BASE16, prefix='0x'))
+      return W_BigBits( nbits, _rbigint_rshift_int( x, shamt ) )
 
     elif isinstance(w_other, W_BigBits):
-      if self.nbits != w_other.nbits:
+      if nbits != w_other.nbits:
         raise oefmt(space.w_ValueError, "Operands of '>>' (rshift) operation must have matching bitwidth, "
-                                        "but here Bits%d != Bits%d.\n", self.nbits, w_other.nbits )
-      return W_BigBits( self.nbits, _rbigint_rshift( x, w_other.bigval ) )
+                                        "but here Bits%d != Bits%d.\n", nbits, w_other.nbits )
+      return W_BigBits( nbits, _rbigint_rshift( x, w_other.bigval ) )
 
     elif type(w_other) is W_LongObject:
       big = w_other.num
-      if _rbigint_invalid_binop_operand( big, self.nbits ):
+      if _rbigint_invalid_binop_operand( big, nbits ):
         raise oefmt(space.w_ValueError, "Integer %s is not a valid binop operand with Bits%d!\n"
-                                        "Suggestion: 0 <= x <= %s", big.format(BASE16, prefix='0x'), self.nbits,
-                                        get_long_mask(self.nbits).format(BASE16, prefix='0x'))
-      return W_BigBits( self.nbits, _rbigint_rshift( x, big ) )
+                                        "Suggestion: 0 <= x <= %s", big.format(BASE16, prefix='0x'), nbits,
+                                        get_long_mask(nbits).format(BASE16, prefix='0x'))
+      return W_BigBits( nbits, _rbigint_rshift( x, big ) )
 
     elif isinstance(w_other, W_SmallBits):
       raise oefmt(space.w_ValueError, "Operands of '>>' (rshift) operation must have matching bitwidth, "
-                                      "but here Bits%d != Bits%d.\n", self.nbits, w_other.nbits )
+                                      "but here Bits%d != Bits%d.\n", nbits, w_other.nbits )
 
     raise oefmt(space.w_TypeError, "Please do rshift between <Bits, Bits/int/long> objects" )
 
   def descr_lshift(self, space, w_other):
 
+    nbits = jit.promote( self.nbits )
     x = self.bigval
 
     if isinstance(w_other, W_IntObject):
       shamt = w_other.intval
       if shamt < 0: # int must be in bigbits range
         raise oefmt(space.w_ValueError, "Integer %s is not a valid binop operand with Bits%d!\n"
-                                        "Suggestion: 0 <= x <= %s", hex(shamt), self.nbits,
-                                        get_long_mask(self.nbits).format(BASE16, prefix='0x'))
-      return W_BigBits( self.nbits, _rbigint_lshift_maskoff( x, shamt, self.nbits ) )
+                                        "Suggestion: 0 <= x <= %s", hex(shamt), nbits,
+                                        get_long_mask(nbits).format(BASE16, prefix='0x'))
+      return W_BigBits( nbits, _rbigint_lshift_maskoff( x, shamt, nbits ) )
 
     elif isinstance(w_other, W_BigBits):
-      if self.nbits != w_other.nbits:
+      if nbits != w_other.nbits:
         raise oefmt(space.w_ValueError, "Operands of '<<' (lshift) operation must have matching bitwidth, "
-                                        "but here Bits%d != Bits%d.\n", self.nbits, w_other.nbits )
+                                        "but here Bits%d != Bits%d.\n", nbits, w_other.nbits )
       shamt = w_other.bigval
-      if shamt.numdigits() > 1: return W_BigBits( self.nbits, NULLRBIGINT ) # rare
+      if shamt.numdigits() > 1: return W_BigBits( nbits, NULLRBIGINT ) # rare
       shamt = shamt.digit(0)
-      return W_BigBits( self.nbits, _rbigint_lshift_maskoff( x, shamt, self.nbits ) )
+      return W_BigBits( nbits, _rbigint_lshift_maskoff( x, shamt, nbits ) )
 
     elif type(w_other) is W_LongObject:
       shamt = w_other.num
-      if _rbigint_invalid_binop_operand( shamt, self.nbits ):
+      if _rbigint_invalid_binop_operand( shamt, nbits ):
         raise oefmt(space.w_ValueError, "Integer %s is not a valid binop operand with Bits%d!\n"
-                                        "Suggestion: 0 <= x <= %s", shamt.format(BASE16, prefix='0x'), self.nbits,
-                                        get_long_mask(self.nbits).format(BASE16, prefix='0x'))
-      if shamt.numdigits() > 1: return W_BigBits( self.nbits, NULLRBIGINT ) # rare
+                                        "Suggestion: 0 <= x <= %s", shamt.format(BASE16, prefix='0x'), nbits,
+                                        get_long_mask(nbits).format(BASE16, prefix='0x'))
+      if shamt.numdigits() > 1: return W_BigBits( nbits, NULLRBIGINT ) # rare
       shamt = shamt.digit(0)
-      return W_BigBits( self.nbits, _rbigint_lshift_maskoff( x, shamt, self.nbits ) )
+      return W_BigBits( nbits, _rbigint_lshift_maskoff( x, shamt, nbits ) )
 
     elif isinstance(w_other, W_SmallBits):
       raise oefmt(space.w_ValueError, "Operands of '<<' (lshift) operation must have matching bitwidth, "
-                                      "but here Bits%d != Bits%d.\n", self.nbits, w_other.nbits )
+                                      "but here Bits%d != Bits%d.\n", nbits, w_other.nbits )
 
     raise oefmt(space.w_TypeError, "Please do lshift between <Bits, Bits/int/long> objects" )
 
@@ -411,30 +394,19 @@ class W_BigBits(W_AbstractBits):
     return newlong( space, self.bigval )
 
   def descr_int(self, space): # TODO
-    index = self.nbits - 1
+    nbits = jit.promote( self.nbits )
+    index = nbits - 1
     bigval = self.bigval
     wordpos = index / SHIFT
-    if wordpos > bigval.numdigits(): # msb must be zero, number is positive
-      return self.descr_uint( space )
+    if wordpos >= bigval.numdigits(): # msb must be zero, number is positive
+      return newlong( space, bigval )
 
     bitpos = index - wordpos*SHIFT
-    word = bigval.digit( wordpos )
-    msb = (word >> bitpos) & 1
+    msb = (bigval.digit( wordpos ) >> bitpos) & 1
     if not msb:
       return newlong( space, bigval )
 
-    # calculate self.nbits's index
-    bitpos += 1
-    if bitpos == SHIFT:
-      wordpos += 1
-      bitpos = 0
-
-    # manually assemble (1 << (index+1))
-    shift = rbigint( [NULLDIGIT]*wordpos + [_store_digit(1 << bitpos)],
-                     1, wordpos+1 )
-
-    res = bigval.sub( shift )
-    return newlong( space, res )
+    return newlong( space, bigval.sub( get_long_pow2( nbits ) ) )
 
   descr_pos = func_with_new_name( descr_uint, 'descr_pos' )
   descr_index = func_with_new_name( descr_uint, 'descr_index' )
@@ -447,21 +419,14 @@ class W_BigBits(W_AbstractBits):
     return space.newbool( self.bigval.sign != 0 )
 
   def descr_invert(self, space):
-    return W_BigBits( self.nbits, get_long_mask(self.nbits).sub( self.bigval ) )
+    nbits = jit.promote( self.nbits )
+    return W_BigBits( nbits, get_long_mask(nbits).sub( self.bigval ) )
 
   # def descr_neg(self, space):
 
   def descr_hash(self, space):
-    hash_nbits = _hash_int( self.nbits )
-    hash_value = _hash_long( space, self.bigval )
-
-    # Manually implement a single iter of W_TupleObject.descr_hash
-
-    x = 0x345678
-    x = (x ^ hash_nbits) * 1000003
-    x = (x ^ hash_value) * (1000003+82520+1+1)
-    x += 97531
-    return space.newint( intmask(x) )
+    nbits = jit.promote( self.nbits )
+    return space.newint( _hash_bits( nbits, _hash_long( space, self.bigval ) ) )
 
   # PyMTL specific
   #        |
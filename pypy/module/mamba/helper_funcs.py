@@ -11,7 +11,7 @@
 # Date   : March 10, 2020
 
 from rpython.rlib import jit
-from rpython.rlib.rbigint import rbigint, SHIFT, NULLDIGIT, ONERBIGINT, \
+from rpython.rlib.rbigint import rbigint, SHIFT, MASK, NULLDIGIT, ONERBIGINT, \
                                  NULLRBIGINT, _store_digit, _x_int_sub, \
                                  _widen_digit, BASE16
 
@@ -23,11 +23,18 @@ BASE2 = '01'
 # * Performing rbigint.and_/rbigint.int_and_ will turn sign back to 1
 # - rbigint._normalize() can only be called in @jit.elidable funcs
 
-mask = rbigint([NULLDIGIT], 1, 1)
-LONG_MASKS = [ mask ]
-for i in xrange(1024):
-  mask = mask.int_mul(2).int_add( 1 )
-  LONG_MASKS.append( mask )
+# Build the masks directly from their digits: i bits of ones is just
+# i/SHIFT full digits plus one partial digit, no arithmetic needed.
+LONG_MASKS = []
+for i in xrange(1025):
+  numwords, rembits = divmod( i, SHIFT )
+  digits = [ _store_digit(MASK) ] * numwords
+  if rembits:
+    digits.append( _store_digit( int((1<<rembits)-1) ) )
+  if digits:
+    LONG_MASKS.append( rbigint( digits, 1, len(digits) ) )
+  else:
+    LONG_MASKS.append( NULLRBIGINT )
 
 def get_long_mask( i ):
   return LONG_MASKS[ i ]
@@ -37,6 +44,15 @@ def get_long_lower( i ):
   return LONG_MASKS[ i-1 ].int_add(1).neg()
 get_long_lower._always_inline_ = True
 
+# 1 << i as an rbigint. It's elidable rather than a table like LONG_MASKS
+# because only sign extension needs it, and with a promoted width the JIT
+# folds the whole call into a constant.
+@jit.elidable
+def get_long_pow2( i ):
+  wordpos = i / SHIFT
+  bitpos  = i - wordpos*SHIFT
+  return rbigint( [NULLDIGIT]*wordpos + [_store_digit(1 << bitpos)], 1, wordpos+1 )
+
 def get_int_mask( i ):
   return int((1<<i)-1)
 get_int_mask._always_inline_ = True
@@ -45,6 +61,11 @@ def get_int_lower( i ):
   return -int(1<<(i-1))
 get_int_mask._always_inline_ = True
 
+# The shift/mask helpers below only ever mask the partial top word of a
+# long value, i.e. maskbit = masklen % SHIFT < SHIFT. Share one table of
+# those masks instead of recomputing (1<<maskbit)-1 in every helper.
+INT_MASKS = [ get_int_mask(i) for i in xrange(SHIFT+1) ]
+
 #-------------------------------------------------------------------------
 # Shunning: The following functions are specialized implementations for
 # Bits arithmetics. Basically we squash arithmetic ops and ANDing mask to
@@ -128,50 +149,80 @@ def _rbigint_maskoff_high( value, masklen ):
   assert masksize > 0 # tell the dumb translator
   # From now on 0 < masksize <= value.numdigits(), so lastword exists
 
-  ret = rbigint(value._digits[:masksize], 1, masksize)
-
   # Here, if masklen % SHIFT == 0, then we don't need to mask the last
   # word because wordpos = masklen / SHIFT = masksize in this case
   maskbit = masklen % SHIFT
+
+  # The mask already covers value, reuse it since rbigint is immutable.
+  # This is the only place that compares the top digit against the mask,
+  # so it saves the copy when nothing would be cleared.
+  if masksize == value.numdigits():
+    if maskbit == 0 or value.digit(lastword) <= INT_MASKS[maskbit]:
+      return value
+
+  ret = rbigint(value._digits[:masksize], 1, masksize)
+
+  # Past the fits-check, just AND the top digit, no second compare
   if maskbit != 0:
-    lastdigit = ret.digit(lastword)
-    mask = get_int_mask(maskbit)
-    if lastdigit >= mask:
-      ret.setdigit( lastword, lastdigit & mask )
+    ret.setdigit( lastword, ret.digit(lastword) & INT_MASKS[maskbit] )
 
-  ret._normalize()
+  # Only a zero top digit can leave leading zeros behind
+  if not ret.digit(lastword):
+    ret._normalize()
   return ret
 
-# This function implements rshift between two rbigints
+# This function implements rshift of an rbigint by a non-negative int
 @jit.elidable
-def _rbigint_rshift( value, shamt ):
-  if not value.sign or not shamt.sign:  return value
-  if shamt.numdigits() > 1: return NULLRBIGINT
-  shamt = shamt.digit(0)
+def _rbigint_rshift_int( value, shamt ):
+  if not value.sign or not shamt:  return value
 
   wordshift = shamt / SHIFT
   newsize = value.numdigits() - wordshift
   if newsize <= 0:  return NULLRBIGINT
 
   loshift = shamt - wordshift*SHIFT
+  # Only the top word survives, no digit loop or normalize needed
+  if newsize == 1:
+    lastword = value.digit(wordshift) >> loshift
+    if not lastword:  return NULLRBIGINT
+    return rbigint([_store_digit(lastword)], 1, 1)
+
+  # Word-aligned shift just drops the low words, a single slice copy
+  if not loshift:
+    ret = rbigint(value._digits[wordshift:wordshift+newsize], 1, newsize)
+    ret._normalize()
+    return ret
+
   hishift = SHIFT - loshift
+  vdigits = value._digits # hoisted, read the digits directly
   ret = rbigint([NULLDIGIT]*newsize, 1, newsize)
 
+  # Keep a single rolling accumulator, each digit is loaded once and
+  # setdigit does the only masking at store time
   i = 0
   lastidx = newsize - 1
-  curword = value.digit(wordshift)
+  accum = vdigits[wordshift] >> loshift
   while i < lastidx:
-    newdigit  = curword >> loshift
-    wordshift = wordshift + 1
-    curword   = value.digit(wordshift)
-    ret.setdigit(i, newdigit | (curword << hishift) )
+    wordshift += 1
+    nextword = vdigits[wordshift]
+    ret.setdigit(i, accum | (nextword << hishift) )
+    accum = nextword >> loshift
     i += 1
   # last digit
-  ret.setdigit(i, curword >> loshift)
+  ret.setdigit(i, accum)
 
-  ret._normalize()
+  if not accum:
+    ret._normalize()
   return ret
-_rbigint_rshift._always_inline_ = 'try' # It's so fast that it's always benefitial.
+_rbigint_rshift_int._always_inline_ = 'try' # It's so fast that it's always benefitial.
+
+# This function implements rshift between two rbigints
+@jit.elidable
+def _rbigint_rshift( value, shamt ):
+  if not value.sign or not shamt.sign:  return value
+  if shamt.numdigits() > 1: return NULLRBIGINT
+  return _rbigint_rshift_int( value, shamt.digit(0) )
+_rbigint_rshift._always_inline_ = 'try'
 
 # This function implements getslice functionality that returns rbigint.
 @jit.elidable
@@ -190,26 +241,36 @@ def _rbigint_rshift_maskoff( value, shamt, masklen ):
 
   loshift = shamt - wordshift*SHIFT
   hishift = SHIFT - loshift
-  ret = rbigint( [NULLDIGIT] * retsize, 1, retsize )
-  i = 0
-  while i < retsize:
-    newdigit = (value.digit(wordshift) >> loshift)
-    if i+1 < newsize:
-      newdigit |= (value.digit(wordshift+1) << hishift)
-    ret.setdigit(i, newdigit)
-    i += 1
-    wordshift += 1
 
+  # Only the last word of the slice needs to be masked, and only if the
+  # slice ends there. Otherwise MASK is a no-op on a stored digit.
+  lastmask = MASK
   if masksize <= retsize:
     maskbit = masklen % SHIFT
     if maskbit != 0:
-      lastword  = i - 1
-      lastdigit = ret.digit(lastword)
-      mask      = get_int_mask(maskbit)
-      if lastdigit >= mask:
-        ret.setdigit( lastword, lastdigit & mask )
+      lastmask = INT_MASKS[maskbit]
 
-  ret._normalize()
+  vdigits = value._digits # hoisted, read the digits directly
+  ret = rbigint( [NULLDIGIT] * retsize, 1, retsize )
+  i = 0
+  lastidx = retsize - 1
+  # Same rolling accumulator as _rbigint_rshift
+  # i+1 < retsize <= newsize, so the next word always exists here
+  accum = vdigits[wordshift] >> loshift
+  while i < lastidx:
+    wordshift += 1
+    nextword = vdigits[wordshift]
+    ret.setdigit(i, accum | (nextword << hishift))
+    accum = nextword >> loshift
+    i += 1
+
+  # last digit, fuse the mask-off into this iteration
+  if retsize < newsize:
+    accum |= vdigits[wordshift+1] << hishift
+  ret.setdigit(i, accum & lastmask)
+
+  if not ret.digit(i):
+    ret._normalize()
   return ret
 _rbigint_rshift_maskoff._always_inline_ = True
 
@@ -248,6 +309,20 @@ def _rbigint_getidx( value, index ):
   return (value.digit(wordpos) >> bitpos) & 1
 _rbigint_getidx._always_inline_ = True
 
+# This function copies the first size digits into a new list of newsize
+# digits, padding the rest with NULLDIGIT. It replaces concatenations like
+# "digits[:size] + [NULLDIGIT]*k + [x]", which allocate and copy several
+# temporary lists. Plain digits[:size] copies are already a single
+# arraycopy after translation and don't need this.
+def _copy_digits( digits, size, newsize ):
+  ret = [NULLDIGIT] * newsize
+  i = 0
+  while i < size:
+    ret[i] = digits[i]
+    i += 1
+  return ret
+_copy_digits._always_inline_ = True
+
 # This function implements setidx functionality.
 @jit.elidable
 def _rbigint_setidx( value, index, other ):
@@ -260,9 +335,9 @@ def _rbigint_setidx( value, index, other ):
 
     bitpos  = index - wordpos*SHIFT
     shift   = 1 << bitpos
-    return rbigint( value._digits[:size] + \
-                    [NULLDIGIT]*(wordpos-size) + \
-                    [_store_digit(shift)], 1, wordpos + 1 )
+    digits  = _copy_digits( value._digits, size, wordpos + 1 )
+    digits[wordpos] = _store_digit(shift)
+    return rbigint( digits, 1, wordpos + 1 )
 
   # wordpos < size
   digit = value.digit(wordpos)
@@ -284,7 +359,7 @@ def _rbigint_setidx( value, index, other ):
   digit ^= shift
   if digit == 0 and wordpos == size-1:
     assert wordpos >= 0
-    return rbigint( value._digits[:wordpos] + [NULLDIGIT], 1, wordpos )
+    return rbigint( _copy_digits( value._digits, wordpos, wordpos + 1 ), 1, wordpos )
 
   ret = rbigint(value._digits[:size], 1, size)
   ret.setdigit( wordpos, digit )
@@ -305,68 +380,84 @@ def _rbigint_lshift_maskoff( value, shamt, masklen ):
 
   oldsize   = value.numdigits()
 
+  # A single digit that doesn't spill into the next word stays a single
+  # digit, and a mask wider than SHIFT can't cut it
+  if oldsize == 1 and shamt < SHIFT and masklen > SHIFT:
+    lastword = value.digit(0)
+    if not (lastword >> (SHIFT - shamt)):
+      return rbigint([_store_digit(lastword << shamt)], 1, 1)
+
   maskbit   = masklen % SHIFT
   masksize  = (masklen - 1)/SHIFT + 1
 
-  if not remshift:
-    retsize = min( oldsize + wordshift, masksize )
-    ret = rbigint( [NULLDIGIT]*retsize, 1, retsize )
-    j = 0
-    while j < oldsize and wordshift < retsize:
-      ret.setdigit( wordshift, value.digit(j) )
-      wordshift += 1
-      j += 1
-
-    if wordshift == masksize and maskbit != 0:
-      lastword = retsize - 1
-      ret.setdigit( lastword, ret.digit(lastword) & get_int_mask(maskbit) )
-
-    ret._normalize()
-    return ret
-
-  newsize  = oldsize + wordshift + 1
-
-  if masksize < newsize:
-    retsize = masksize
+  # One more word for the bits shifted out of the top digit
+  newsize   = oldsize + wordshift
+  if remshift:
+    newsize += 1
+  retsize   = min( newsize, masksize )
 
-    ret = rbigint([NULLDIGIT]*retsize, 1, retsize)
-    accum = _widen_digit(0)
-    j = 0
-    while j < oldsize and wordshift < retsize:
-      accum += value.widedigit(j) << remshift
-      ret.setdigit(wordshift, accum)
-      accum >>= SHIFT
-      wordshift += 1
-      j += 1
-
-    # no accum
-    if maskbit != 0:
-      lastword  = retsize - 1
-      lastdigit = ret.digit(lastword)
-      mask      = get_int_mask(maskbit)
-      if lastdigit >= mask:
-        ret.setdigit( lastword, lastdigit & mask )
-
-    ret._normalize()
-    return ret
-
-  # masksize >= newsize
-  retsize = newsize
+  # Only the top word of the mask can be partial
+  lastmask  = MASK
+  if retsize == masksize and maskbit != 0:
+    lastmask = INT_MASKS[maskbit]
 
   ret = rbigint([NULLDIGIT]*retsize, 1, retsize)
   accum = _widen_digit(0)
+  lastword = retsize - 1
   j = 0
-  while j < oldsize and wordshift < retsize:
+  # j < oldsize always holds in here
+  while wordshift < lastword:
     accum += value.widedigit(j) << remshift
     ret.setdigit(wordshift, accum)
     accum >>= SHIFT
     wordshift += 1
     j += 1
 
-  if masksize == newsize and maskbit != 0:
-    accum &= get_int_mask(maskbit)
+  # last word, only the carry is left if value is used up
+  if j < oldsize:
+    accum += value.widedigit(j) << remshift
+  ret.setdigit(lastword, accum & lastmask)
+
+  if not ret.digit(lastword):
+    ret._normalize()
+  return ret
+
+# This function clears [start:stop] of value. Assigning zero to a slice
+# is a very common reset pattern, so return value itself if nothing in
+# the range is set instead of building a new rbigint.
+@jit.elidable
+def _rbigint_setrange_zero( value, start, stop ):
+  if not value.sign: return value
+
+  vsize     = value.numdigits()
+  wordstart = start / SHIFT
+  if wordstart >= vsize: return value
 
-  ret.setdigit(wordshift, accum)
+  wordstop = stop / SHIFT
+  if wordstop >= vsize: # clear everything above start
+    if not start: return NULLRBIGINT
+    return _rbigint_maskoff_high( value, start )
+
+  bitstart = start - wordstart*SHIFT
+  bitstop  = stop - wordstop*SHIFT
+  maskstart = get_int_mask(bitstart)
+  maskstop  = get_int_mask(bitstop)
+
+  if wordstart == wordstop:
+    valstart = value.digit(wordstart)
+    rangemask = maskstop - maskstart
+    if not (valstart & rangemask): return value # already zero
+    ret = rbigint( value._digits[:vsize], 1, vsize )
+    ret.setdigit( wordstart, valstart & ~rangemask )
+
+  else:
+    ret = rbigint( value._digits[:vsize], 1, vsize )
+    ret.setdigit( wordstart, ret.digit(wordstart) & maskstart )
+    i = wordstart + 1
+    while i < wordstop:
+      ret._digits[i] = NULLDIGIT
+      i += 1
+    ret.setdigit( wordstop, ret.digit(wordstop) & ~maskstop )
 
   ret._normalize()
   return ret
@@ -377,6 +468,9 @@ def _rbigint_lshift_maskoff( value, shamt, masklen ):
 # Must return rbigint that cannot fit into int
 @jit.elidable
 def setitem_long_long_helper( value, other, start, stop ):
+  if not other.sign:
+    return _rbigint_setrange_zero( value, start, stop )
+
   if other.numdigits() <= 1:
     return setitem_long_int_helper( value, other.digit(0), start, stop )
 
@@ -433,7 +527,7 @@ def setitem_long_long_helper( value, other, start, stop ):
   # wordstop == osize - 1 means other's last word is wordstop
   if wordstop == osize - 1:
     while i < wordstop:
-      ret.setdigit(i, other.digit(i) )
+      ret._digits[i] = other._digits[i] # already valid digits, no need to mask
       i += 1
     # union stop
     value_hi = ret.digit(wordstop) & inv_maskstop # hi
@@ -442,7 +536,7 @@ def setitem_long_long_helper( value, other, start, stop ):
   # wordstop > osize - 1, other is shorter
   else:
     while i < osize:
-      ret.setdigit(i, other.digit(i) )
+      ret._digits[i] = other._digits[i] # already valid digits, no need to mask
       i += 1
     while i < wordstop:
       ret._digits[i] = NULLDIGIT
@@ -454,6 +548,35 @@ def setitem_long_long_helper( value, other, start, stop ):
   ret._normalize()
   return ret
 
+# Two-word fast path. Bits whose value fits in two digits (e.g. Bits64
+# when SHIFT=63) are very common, so we operate on the two words as
+# plain ints instead of copying and patching the digit list.
+# Shunning: CALL IT WITH 0 <= other < 2**(stop-start), stop <= 2*SHIFT,
+# and value.numdigits() <= 2
+def _setitem_two_words_int( value, other, start, stop ):
+  lo = value.digit(0)
+  hi = 0
+  if value.numdigits() > 1:
+    hi = value.digit(1)
+
+  if stop <= SHIFT:
+    lo = (lo & ~(get_int_mask(stop - start) << start)) | (other << start)
+  elif start >= SHIFT:
+    start -= SHIFT
+    stop  -= SHIFT
+    hi = (hi & ~(get_int_mask(stop - start) << start)) | (other << start)
+  else: # the slice straddles the two words
+    lo_nbits = SHIFT - start
+    lo = (lo & get_int_mask(start)) | ((other & get_int_mask(lo_nbits)) << start)
+    hi = (hi & ~get_int_mask(stop - SHIFT)) | (other >> lo_nbits)
+
+  if hi:
+    return rbigint( [_store_digit(lo), _store_digit(hi)], 1, 2 )
+  if lo:
+    return rbigint( [_store_digit(lo)], 1, 1 )
+  return NULLRBIGINT
+_setitem_two_words_int._always_inline_ = True
+
 @jit.elidable
 def setitem_long_int_helper( value, other, start, stop ):
   vsize = value.numdigits()
@@ -465,30 +588,34 @@ def setitem_long_int_helper( value, other, start, stop ):
       tmp = get_long_mask(slice_nbits).int_and_( other )
       return setitem_long_long_helper( value, tmp, start, stop )
 
+  if not other:
+    return _rbigint_setrange_zero( value, start, stop )
+
+  if vsize <= 2 and stop <= 2*SHIFT:
+    return _setitem_two_words_int( value, other, start, stop )
+
   # wordstart must < wordstop
   wordstart = start / SHIFT
   bitstart  = start - wordstart*SHIFT
 
   # vsize <= wordstart < wordstop, concatenate
   if wordstart >= vsize:
-    if not other: return value # if other is zero, do nothing
-
     if not bitstart: # aha, not chopped into two parts
-      return rbigint( value._digits[:vsize] + \
-                      [NULLDIGIT]*(wordstart-vsize) + \
-                      [_store_digit(other)], 1, wordstart+1 )
+      digits = _copy_digits( value._digits, vsize, wordstart+1 )
+      digits[wordstart] = _store_digit(other)
+      return rbigint( digits, 1, wordstart+1 )
 
     # split into two parts
     lo = SHIFT-bitstart
     val1 = other & get_int_mask(lo)
     if val1 == other: # aha, the higher part is zero
-      return rbigint( value._digits[:vsize] + \
-                      [NULLDIGIT]*(wordstart-vsize) + \
-                      [_store_digit(val1 << bitstart)], 1, wordstart+1 )
-    return rbigint( value._digits[:vsize] + \
-                    [NULLDIGIT]*(wordstart-vsize) + \
-                    [_store_digit(val1 << bitstart)] + \
-                    [_store_digit(other >> lo)], 1, wordstart+2 )
+      digits = _copy_digits( value._digits, vsize, wordstart+1 )
+      digits[wordstart] = _store_digit(val1 << bitstart)
+      return rbigint( digits, 1, wordstart+1 )
+    digits = _copy_digits( value._digits, vsize, wordstart+2 )
+    digits[wordstart]   = _store_digit(val1 << bitstart)
+    digits[wordstart+1] = _store_digit(other >> lo)
+    return rbigint( digits, 1, wordstart+2 )
 
   wordstop = stop / SHIFT
   bitstop  = stop - wordstop*SHIFT
@@ -536,8 +663,7 @@ def setitem_long_int_helper( value, other, start, stop ):
   # wordstart < vsize <= wordstop, highest bits will be cleared
   newsize = wordstart + 2 #
   assert wordstart >= 0
-  ret = rbigint( value._digits[:wordstart] + \
-                [NULLDIGIT, NULLDIGIT], 1, newsize )
+  ret = rbigint( _copy_digits( value._digits, wordstart, newsize ), 1, newsize )
 
   bitstart = start - wordstart*SHIFT
   if not bitstart:
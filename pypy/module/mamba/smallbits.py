@@ -2,8 +2,8 @@
 import operator
 
 from rpython.rlib import jit
-from rpython.rlib.rarithmetic import intmask
-from rpython.rlib.rbigint     import rbigint, SHIFT, BASE8, BASE16
+from rpython.rlib.rarithmetic import intmask, r_uint
+from rpython.rlib.rbigint     import rbigint, SHIFT, BASE16
 from rpython.tool.sourcetools import func_renamer, func_with_new_name
 
 from pypy.interpreter.baseobjspace import W_Root
@@ -20,43 +20,39 @@ from pypy.module.mamba.helper_funcs import BASE2, get_int_mask, get_long_mask, g
   _rbigint_rshift, _rbigint_rshift_maskoff, _rbigint_rshift_maskoff_retint, _rbigint_getidx, \
   _rbigint_setidx, _rbigint_lshift_maskoff, setitem_long_long_helper, setitem_long_int_helper
 
-def _get_slice_range(space, nbits, w_start, w_stop):
+# Unwrap an int/long/Bits index. Exact ints come first since they are
+# by far the most common index type.
+def _unwrap_bits_index(space, nbits, w_index, what):
   from pypy.module.mamba.bigbits import W_BigBits
-  start = 0
 
-  if   isinstance(w_start, W_IntObject): start = w_start.intval
-  elif isinstance(w_start, W_SmallBits): start = w_start.intval
-  elif space.is_w(w_start, space.w_None): pass
-  elif isinstance(w_start, W_BigBits):
-    try:
-      start = w_start.bigval.toint()
-    except OverflowError:
-      raise oefmt(space.w_IndexError, "Index [%s] too big for Bits%d", rbigint.str(w_start.bigval), nbits )
-  elif isinstance(w_start, W_LongObject):
+  if type(w_index) is W_IntObject:
+    return w_index.intval
+  elif isinstance(w_index, W_SmallBits):
+    return w_index.intval
+  elif isinstance(w_index, W_BigBits):
+    # Bits values are non-negative, so a single digit is the value itself
+    tmp = w_index.bigval
+    if tmp.numdigits() > 1:
+      raise oefmt(space.w_IndexError, "Index [%s] too big for Bits%d", rbigint.str(tmp), nbits )
+    return tmp.digit(0)
+  elif isinstance(w_index, W_IntObject):
+    return w_index.intval
+  elif isinstance(w_index, W_LongObject):
     try:
-      start = w_start.num.toint()
+      return w_index.num.toint()
     except OverflowError:
-      raise oefmt(space.w_IndexError, "Index [%s] too big for Bits%d",
-                                      rbigint.str(w_start.num), nbits )
-  else:
-    raise oefmt(space.w_TypeError, "Please pass in int/Bits variables for slice's start." )
+      raise oefmt(space.w_IndexError, "Index [%s] too big for Bits%d", rbigint.str(w_index.num), nbits )
+  raise oefmt(space.w_TypeError, "Please pass in int/Bits variables for %s", what )
+_unwrap_bits_index._always_inline_ = True
+
+def _get_slice_range(space, nbits, w_start, w_stop):
+  start = 0
+  if not space.is_w(w_start, space.w_None):
+    start = _unwrap_bits_index(space, nbits, w_start, "slice's start." )
 
   stop = nbits
-  if isinstance(w_stop, W_IntObject):   stop = w_stop.intval
-  elif isinstance(w_stop, W_SmallBits): stop = w_stop.intval
-  elif space.is_w(w_stop, space.w_None): pass
-  elif isinstance(w_stop, W_BigBits):
-    try:
-      stop = w_stop.bigval.toint()
-    except OverflowError:
-      raise oefmt(space.w_IndexError, "Index [%s] too big for Bits%d", rbigint.str(w_stop.bigval), nbits )
-  elif type(w_stop) is W_LongObject:
-    try:
-      stop = w_stop.num.toint()
-    except OverflowError:
-      raise oefmt(space.w_IndexError, "Index [%s] too big for Bits%d", rbigint.str(w_stop.num), nbits )
-  else:
-    raise oefmt(space.w_TypeError, "Please pass in int/Bits variables for slice's stop." )
+  if not space.is_w(w_stop, space.w_None):
+    stop = _unwrap_bits_index(space, nbits, w_stop, "slice's stop." )
 
   if start >= stop: raise oefmt(space.w_IndexError, "Invalid range: start [%d] >= stop [%d]", start, stop )
   if start < 0:     raise oefmt(space.w_IndexError, "Negative start: [%d]", start )
@@ -64,27 +60,56 @@ def _get_slice_range(space, nbits, w_start, w_stop):
   return start, stop
 
 def _get_index(space, nbits, w_index):
-  from pypy.module.mamba.bigbits import W_BigBits
-  index = 0
-  if isinstance(w_index, W_SmallBits): index = w_index.intval
-  elif type(w_index) is W_IntObject: index = w_index.intval
-  elif isinstance(w_index, W_BigBits):
-    try:
-      index = w_index.bigval.toint()
-    except OverflowError:
-      raise oefmt(space.w_IndexError, "Index [%s] too big for Bits%d", rbigint.str(w_index.bigval), nbits )
-  elif type(w_index) is W_LongObject:
-    try:
-      index = w_index.num.toint()
-    except OverflowError:
-      raise oefmt(space.w_IndexError, "Index [%s] too big for Bits%d", rbigint.str(w_index.num), nbits )
-  else:
-    raise oefmt(space.w_TypeError, "Please pass in int/Bits variables for slice index" )
+  index = _unwrap_bits_index(space, nbits, w_index, "slice index" )
 
   if index < 0:       raise oefmt(space.w_IndexError, "Negative index: [%d]", index )
   if index >= nbits:  raise oefmt(space.w_IndexError, "Index [%d] too big for Bits%d", index, nbits )
   return index
 
+# This function unwraps the operand of a W_SmallBits cmp/binop into an
+# int in [0, 2**nbits). It returns -1 if w_other is not Bits/int/long so
+# that the caller decides how to fail, e.g. __eq__ shouldn't raise.
+def _unwrap_small_operand(space, nbits, w_other, opname):
+  from pypy.module.mamba.bigbits import W_BigBits
+
+  if isinstance(w_other, W_SmallBits):
+    if nbits != w_other.nbits:
+      raise oefmt(space.w_ValueError, "Operands of '%s' operation must have matching bitwidth, "
+                                      "but here Bits%d != Bits%d.\n", opname, nbits, w_other.nbits )
+    return w_other.intval
+
+  elif isinstance(w_other, W_IntObject):
+    y = w_other.intval
+    mask = get_int_mask(nbits)
+    if y < 0 or y > mask:
+      raise oefmt(space.w_ValueError, "Integer %s is not a valid binop operand with Bits%d!\n"
+                                      "Suggestion: 0 <= x <= %s", hex(y), nbits, hex(mask) )
+    return y
+
+  elif type(w_other) is W_LongObject:
+    y = w_other.num
+    if _rbigint_invalid_binop_operand( y, nbits ):
+      raise oefmt(space.w_ValueError, "Integer %s is not a valid binop operand with Bits%d!\n"
+                                      "Suggestion: 0 <= x <= %s", y.format(BASE16, prefix='0x'), nbits,
+                                      get_long_mask(nbits).format(BASE16, prefix='0x'))
+    # 0 <= y < 2**nbits <= 2**SHIFT, a single digit
+    return y.digit(0)
+
+  elif isinstance(w_other, W_BigBits):
+    raise oefmt(space.w_ValueError, "Operands of '%s' operation must have matching bitwidth, "
+                                    "but here Bits%d != Bits%d.\n", opname, nbits, w_other.nbits )
+  return -1
+
+# Manually implement a single iter of W_TupleObject.descr_hash over
+# (nbits, value). Bits are mutable so the hash can't be cached, but the
+# nbits half only depends on the width and folds once nbits is promoted.
+def _hash_bits( nbits, hash_value ):
+  x = (0x345678 ^ _hash_int( nbits )) * 1000003
+  x = (x ^ hash_value) * (1000003+82520+1+1)
+  x += 97531
+  return intmask(x)
+_hash_bits._always_inline_ = True
+
 cmp_opp = {
   'lt': 'gt',
   'le': 'ge',
@@ -192,6 +217,9 @@ class W_AbstractBits(W_Root):
     if nbits <= SHIFT:
       if nbits < 1:
         raise oefmt(space.w_ValueError, "Only support 1 <= nbits < 1024, not %d", nbits)
+      # Designs construct a handful of widths over and over, promote so
+      # the masks and range checks below fold per width
+      nbits = jit.promote( nbits )
 
       ret = space.allocate_instance( W_SmallBits, w_objtype )
       ret.nbits = nbits
@@ -382,24 +410,26 @@ class W_SmallBits(W_AbstractBits):
   #-----------------------------------------------------------------------
 
   def descr_getitem(self, space, w_index):
+    nbits = jit.promote( self.nbits )
     if type(w_index) is W_SliceObject: # [a:b]
       if space.is_w(w_index.w_step, space.w_None):
-        start, stop = _get_slice_range( space, self.nbits, w_index.w_start, w_index.w_stop )
+        start, stop = _get_slice_range( space, nbits, w_index.w_start, w_index.w_stop )
         slice_nbits = stop - start
         res = (self.intval >> start) & get_int_mask(slice_nbits)
         return W_SmallBits( slice_nbits, res )
       else:
         raise oefmt(space.w_IndexError, "Index cannot contain step" )
     else: # [a]
-      index = _get_index(space, self.nbits, w_index)
+      index = _get_index(space, nbits, w_index)
       return W_SmallBits( 1, (self.intval >> index) & 1 )
 
   def descr_setitem(self, space, w_index, w_other):
     from pypy.module.mamba.bigbits import W_BigBits
 
+    nbits = jit.promote( self.nbits )
     if type(w_index) is W_SliceObject:
       if space.is_w(w_index.w_step, space.w_None):
-        start, stop = _get_slice_range( space, self.nbits, w_index.w_start, w_index.w_stop )
+        start, stop = _get_slice_range( space, nbits, w_index.w_start, w_index.w_stop )
         slice_nbits = stop - start
 
         if isinstance(w_other, W_SmallBits):
@@ -410,19 +440,23 @@ class W_SmallBits(W_AbstractBits):
             else:
               raise oefmt(space.w_ValueError, "Cannot fit a Bits%d object into a %d-bit slice [%d:%d]\n"
                                               "- Suggestion: trunc the RHS", w_other.nbits, slice_nbits, start, stop)
-          valuemask   = ~(get_int_mask(slice_nbits) << start)
+          # The widths match, so w_other.intval is already masked to the
+          # slice. Build the mask from the immutable nbits field, which
+          # the JIT can fold, rather than from the computed slice width.
+          valuemask   = ~(get_int_mask(w_other.nbits) << start)
           self.intval = (self.intval & valuemask) | (w_other.intval << start)
 
         elif isinstance(w_other, W_IntObject):
           other = w_other.intval
-          up = get_int_mask(slice_nbits)
-          lo = get_int_lower(slice_nbits)
 
-          if other < lo or other > up:
+          # other fits iff 0 <= other < 2**n or -2**(n-1) <= other < 0.
+          if (other >> slice_nbits) != 0 and (~other >> (slice_nbits-1)) != 0:
             raise oefmt(space.w_ValueError, "Cannot fit value %s into a Bits%d slice!\n"
                                             "(Bits%d only accepts %s <= value <= %s)",
-                                            hex(other), slice_nbits, slice_nbits, hex(lo), hex(up))
+                                            hex(other), slice_nbits, slice_nbits,
+                                            hex(get_int_lower(slice_nbits)), hex(get_int_mask(slice_nbits)))
 
+          up = get_int_mask(slice_nbits)
           other &= up
           valuemask = ~(up << start)
           self.intval = (self.intval & valuemask) | (other << start)
@@ -447,7 +481,7 @@ class W_SmallBits(W_AbstractBits):
         raise oefmt(space.w_IndexError, "Index cannot contain step." )
 
     else:
-      index = _get_index(space, self.nbits, w_index)
+      index = _get_index(space, nbits, w_index)
 
       # Check value bitlen. No need to check Bits, but check int/long.
       if isinstance(w_other, W_SmallBits):
@@ -483,47 +517,20 @@ class W_SmallBits(W_AbstractBits):
 
   def _make_descr_cmp(opname):
     iiop  = getattr( operator, opname )
-    ilopp = getattr( rbigint , "int_"+cmp_opp[opname] )
 
     @func_renamer('descr_' + opname)
     def descr_cmp(self, space, w_other):
-      from pypy.module.mamba.bigbits import W_BigBits
-      x = self.intval
-
-      if   isinstance(w_other, W_SmallBits):
-        if self.nbits != w_other.nbits:
-          raise oefmt(space.w_ValueError, "Operands of '%s' operation must have matching bitwidth, "
-                                          "but here Bits%d != Bits%d.\n", opname, self.nbits, w_other.nbits )
-        return W_SmallBits( 1, iiop( x, w_other.intval ) )
-
-      elif isinstance(w_other, W_IntObject):
-        y = w_other.intval
-        mask = get_int_mask(self.nbits)
-        if y < 0 or y > mask:
-          raise oefmt(space.w_ValueError, "Integer %s is not a valid binop operand with Bits%d!\n"
-                                          "Suggestion: 0 <= x <= %s", hex(y), self.nbits, hex(mask) )
-        return W_SmallBits( 1, iiop( x, y & mask ) )
-
-      elif type(w_other) is W_LongObject:
-        y = w_other.num
-        if _rbigint_invalid_binop_operand( y, self.nbits ):
-          raise oefmt(space.w_ValueError, "Integer %s is not a valid binop operand with Bits%d!\n"
-                                          "Suggestion: 0 <= x <= %s", y.format(BASE16, prefix=' 0x'), self.nbits,
-                                          get_long_mask(self.nbits).format(BASE16, prefix='0x'))
-        return W_SmallBits( 1, ilopp( get_long_mask(self.nbits).and_( y ), x ) )
-
-      elif isinstance(w_other, W_BigBits):
-        raise oefmt(space.w_ValueError, "Operands of '%s' operation must have matching bitwidth, "
-                                        "but here Bits%d != Bits%d.\n", opname, self.nbits, w_other.nbits )
-
-      if opname == 'eq':
-        # Match cpython behavior
-        return W_SmallBits( 1, 0 )
-      elif opname == 'ne':
-        # Match cpython behavior
-        return W_SmallBits( 1, 1 )
-
-      raise oefmt(space.w_TypeError, "Please compare two Bits/int/long objects" )
+      y = _unwrap_small_operand( space, jit.promote( self.nbits ), w_other, opname )
+      if y < 0:
+        if opname == 'eq':
+          # Match cpython behavior
+          return W_SmallBits( 1, 0 )
+        elif opname == 'ne':
+          # Match cpython behavior
+          return W_SmallBits( 1, 1 )
+        raise oefmt(space.w_TypeError, "Please compare two Bits/int/long objects" )
+
+      return W_SmallBits( 1, iiop( self.intval, y ) )
 
     return descr_cmp
 
@@ -543,102 +550,37 @@ class W_SmallBits(W_AbstractBits):
   def _make_descr_binop_opname(opname, ovf=True):
     # Shunning: shouldn't overwrite opname -- "and_" is not in COMMUTATIVE_OPS
     _opn = opname + ('_' if opname in ('and', 'or') else '')
-    llop = getattr( rbigint, _opn )
-    liop = getattr( rbigint, "int_"+_opn )
     iiop = getattr( operator, _opn )
 
     @func_renamer('descr_' + opname)
     def descr_binop(self, space, w_other):
-      from pypy.module.mamba.bigbits import W_BigBits
-      nbits = self.nbits
-      # add, sub, mul
-      if ovf:
-        x = self.intval
+      nbits = jit.promote( self.nbits )
+      y = _unwrap_small_operand( space, nbits, w_other, opname )
+      if y < 0:
+        raise oefmt(space.w_TypeError, "Please do %s between Bits and Bits/int/long objects", opname)
 
-        if isinstance(w_other, W_SmallBits):
-          y = w_other.intval
-          if nbits != w_other.nbits:
-            raise oefmt(space.w_ValueError, "Operands of '%s' operation must have matching bitwidth, "
-                                            "but here Bits%d != Bits%d.\n", opname, nbits, w_other.nbits )
-          mask = get_int_mask(nbits)
-          try:
-            z = ovfcheck( iiop(x, y) )
-            return W_SmallBits( nbits, z & mask )
-          except OverflowError:
-            z = liop( rbigint.fromint(x), y )
-            if opname in COMMUTATIVE_OPS: # add, mul
-              z = z.digit(0) & mask
-            else: # sub, should AND mask
-              z = z.int_and_( mask ).digit(0)
-            return W_SmallBits( nbits, z )
+      x = self.intval
+      mask = get_int_mask(nbits)
 
-        elif isinstance(w_other, W_IntObject):
-          y = w_other.intval
-          mask = get_int_mask(nbits)
-          if y < 0 or y > mask:
-            raise oefmt(space.w_ValueError, "Integer %s is not a valid binop operand with Bits%d!\n"
-                                            "Suggestion: 0 <= x <= %s", hex(y), self.nbits, hex(mask) )
-          try:
-            z = ovfcheck( iiop(x, y) )
-            return W_SmallBits( nbits, z & mask )
-          except OverflowError:
-            z = liop( rbigint.fromint(x), y )
-            if opname in COMMUTATIVE_OPS: # add, mul
-              z = z.digit(0) & mask
-            else: # sub, should AND mask
-              z = z.int_and_( mask ).digit(0)
-            return W_SmallBits( nbits, z )
-
-        elif type(w_other) is W_LongObject:
-          y = w_other.num
-          if _rbigint_invalid_binop_operand( y, self.nbits ):
-            raise oefmt(space.w_ValueError, "Integer %s is not a valid binop operand with Bits%d!\n"
-                                            "Suggestion: 0 <= x <= %s", y.format(BASE16, prefix='0x'), nbits,
-                                            get_long_mask(nbits).format(BASE16, prefix='0x'))
-
-          mask = get_int_mask(nbits)
-          if opname in COMMUTATIVE_OPS: # add, mul
-            z = liop(y, x).int_and_( mask )
-            return W_SmallBits( nbits, z.digit(0) )
-          else: # sub
-            z = llop( rbigint.fromint(x), y ).int_and_( mask )
-            return W_SmallBits( nbits, z.digit(0) )
+      # The bare machine division below is unchecked, raise here instead
+      if opname in ('floordiv', 'mod') and y == 0:
+        raise oefmt(space.w_ZeroDivisionError, "integer division or modulo by zero")
 
-        elif isinstance(w_other, W_BigBits):
-          raise oefmt(space.w_ValueError, "Operands of '%s' operation must have matching bitwidth, "
-                                          "but here Bits%d != Bits%d.\n", opname, nbits, w_other.nbits )
+      # add, sub, mul
+      if ovf:
+        try:
+          z = ovfcheck( iiop(x, y) )
+          return W_SmallBits( nbits, z & mask )
+        except OverflowError:
+          # Both operands are in [0, mask], so only the low nbits of the
+          # result matter and wrapping machine-word arithmetic gets them
+          # right without going through rbigint
+          z = intmask( iiop( r_uint(x), r_uint(y) ) ) & mask
+          return W_SmallBits( nbits, z )
 
       # and, or, xor, no overflow
       # opname should be in COMMUTATIVE_OPS
-      else:
-        x = self.intval
-        if isinstance(w_other, W_SmallBits):
-          if nbits != w_other.nbits:
-            raise oefmt(space.w_ValueError, "Operands of '%s' operation must have matching bitwidth, "
-                                            "but here Bits%d != Bits%d.\n", opname, nbits, w_other.nbits )
-          return W_SmallBits( nbits, iiop( x, w_other.intval ) )
-
-        elif isinstance(w_other, W_IntObject):
-          y = w_other.intval
-          mask = get_int_mask(nbits)
-          if y < 0 or y > mask:
-            raise oefmt(space.w_ValueError, "Integer %s is not a valid binop operand with Bits%d!\n"
-                                            "Suggestion: 0 <= x <= %s", hex(y), nbits, hex(mask) )
-          return W_SmallBits( nbits, iiop( x, y & mask ) )
-
-        elif type(w_other) is W_LongObject:
-          y = w_other.num
-          if _rbigint_invalid_binop_operand( y, nbits ):
-            raise oefmt(space.w_ValueError, "Integer %s is not a valid binop operand with Bits%d!\n"
-                                            "Suggestion: 0 <= x <= %s", y.format(BASE16, prefix='0x'), nbits,
-                                            get_long_mask(nbits).format(BASE16, prefix='0x'))
-          return W_SmallBits( nbits, iiop( x, w_other.num.int_and_( get_int_mask(nbits) ).digit(0) ) )
-
-        elif isinstance(w_other, W_BigBits):
-          raise oefmt(space.w_ValueError, "Operands of '%s' operation must have matching bitwidth, "
-                                          "but here Bits%d != Bits%d.\n", opname, nbits, w_other.nbits )
-
-      raise oefmt(space.w_TypeError, "Please do %s between Bits and Bits/int/long objects", opname)
+      return W_SmallBits( nbits, iiop( x, y ) )
 
     if opname in COMMUTATIVE_OPS:
       @func_renamer('descr_r' + opname)
@@ -653,37 +595,42 @@ class W_SmallBits(W_AbstractBits):
     return descr_binop, descr_rbinop
 
   def _make_descr_rbinop_opname(opname):
-    liop = getattr( rbigint, "int_"+opname )
     iiop = getattr( operator, opname )
 
     @func_renamer('descr_r' + opname)
     def descr_rbinop(self, space, w_other):
-      nbits = self.nbits
+      nbits = jit.promote( self.nbits )
+      mask = get_int_mask(nbits)
       y = self.intval
 
       if isinstance(w_other, W_IntObject):
         x = w_other.intval
-        mask = get_int_mask(nbits)
         if x < 0 or x > mask:
           raise oefmt(space.w_ValueError, "Integer %s is not a valid binop operand with Bits%d!\n"
                                           "Suggestion: 0 <= x <= %s", hex(x), nbits, hex(mask) )
-        try:
-          z = ovfcheck( iiop(x, y) )
-          return W_SmallBits( nbits, z & mask )
-        except OverflowError:
-          z = liop( rbigint.fromint(x), y ).int_and_( mask ).digit(0)
-          return W_SmallBits( nbits, z )
 
       elif type(w_other) is W_LongObject:
-        x = w_other.num
-
-        if _rbigint_invalid_binop_operand( x, nbits ):
+        big = w_other.num
+        if _rbigint_invalid_binop_operand( big, nbits ):
           raise oefmt(space.w_ValueError, "Integer %s is not a valid binop operand with Bits%d!\n"
-                                          "Suggestion: 0 <= x <= %s", x.format(BASE16, prefix='0x'), nbits,
+                                          "Suggestion: 0 <= x <= %s", big.format(BASE16, prefix='0x'), nbits,
                                           get_long_mask(nbits).format(BASE16, prefix='0x'))
+        # 0 <= big < 2**nbits <= 2**SHIFT, a single digit
+        x = big.digit(0)
 
-        z = liop( x, y ).int_and_( get_int_mask(nbits) )
-        return W_SmallBits( nbits, z.digit(0) )
+      else:
+        return None
+
+      # The bare machine division below is unchecked, raise here instead
+      if opname in ('floordiv', 'mod') and y == 0:
+        raise oefmt(space.w_ZeroDivisionError, "integer division or modulo by zero")
+
+      try:
+        z = ovfcheck( iiop(x, y) )
+        return W_SmallBits( nbits, z & mask )
+      except OverflowError:
+        z = intmask( iiop( r_uint(x), r_uint(y) ) ) & mask
+        return W_SmallBits( nbits, z )
     return descr_rbinop
 
   descr_add, descr_radd = _make_descr_binop_opname('add')
@@ -701,84 +648,26 @@ class W_SmallBits(W_AbstractBits):
   descr_rmod      = _make_descr_rbinop_opname('mod')
 
   def descr_rshift(self, space, w_other):
-    from pypy.module.mamba.bigbits import W_BigBits
-
-    nbits = self.nbits
-    x = self.intval
-    if isinstance(w_other, W_SmallBits):
-      if nbits != w_other.nbits:
-        raise oefmt(space.w_ValueError, "Operands of '>>' (rshift) operation must have matching bitwidth, "
-                                        "but here Bits%d != Bits%d.\n", nbits, w_other.nbits )
-      shamt = w_other.intval
-      if shamt <= SHIFT:  return W_SmallBits( nbits, x >> shamt )
-      return W_SmallBits( nbits )
+    nbits = jit.promote( self.nbits )
+    shamt = _unwrap_small_operand( space, nbits, w_other, '>>' )
+    if shamt < 0:
+      raise oefmt(space.w_TypeError, "Please do rshift between <Bits, Bits/int/long> objects" )
 
-    elif isinstance(w_other, W_IntObject):
-      shamt = w_other.intval
-      if shamt < 0 or shamt > get_int_mask(nbits):
-        raise oefmt(space.w_ValueError, "Integer %s is not a valid binop operand with Bits%d!\n"
-                                        "Suggestion: 0 <= x <= %s", hex(shamt), nbits, hex(get_int_mask(nbits)) )
-      if shamt <= SHIFT:  return W_SmallBits( nbits, x >> shamt )
-      return W_SmallBits( nbits )
-
-    elif isinstance(w_other, W_LongObject):
-      big = w_other.num
-
-      if _rbigint_invalid_binop_operand( big, nbits ):
-        raise oefmt(space.w_ValueError, "Integer %s is not a valid binop operand with Bits%d!\n"
-                                        "Suggestion: 0 <= x <= %s", big.format(BASE16, prefix='0x'), nbits,
-                                        get_long_mask(nbits).format(BASE16, prefix='0x'))
-
-      shamt = big.digit(0)
-      if big.numdigits() == 1 and shamt <= SHIFT:
-        return W_SmallBits( nbits, x >> shamt )
-      return W_SmallBits( nbits )
-
-    elif isinstance(w_other, W_BigBits):
-      raise oefmt(space.w_ValueError, "Operands of '>>' (rshift) operation must have matching bitwidth, "
-                                      "but here Bits%d != Bits%d.\n", nbits, w_other.nbits )
-
-    raise oefmt(space.w_TypeError, "Please do rshift between <Bits, Bits/int/long> objects" )
+    # x < 2**nbits, so any shamt >= nbits clears it. This also keeps
+    # the machine shift amount below the word size
+    if shamt >= nbits:  return W_SmallBits( nbits )
+    return W_SmallBits( nbits, self.intval >> shamt )
 
   def descr_lshift(self, space, w_other):
-    from pypy.module.mamba.bigbits import W_BigBits
+    nbits = jit.promote( self.nbits )
+    shamt = _unwrap_small_operand( space, nbits, w_other, '<<' )
+    if shamt < 0:
+      raise oefmt(space.w_TypeError, "Please do lshift between <Bits, Bits/int/long> objects" )
 
-    nbits = self.nbits
-    x = self.intval
-    if isinstance(w_other, W_SmallBits):
-      if nbits != w_other.nbits:
-        raise oefmt(space.w_ValueError, "Operands of '<<' (lshift) operation must have matching bitwidth, "
-                                        "but here Bits%d != Bits%d.\n", nbits, w_other.nbits )
-      shamt = w_other.intval
-
-      if shamt >= nbits:  return W_SmallBits( nbits )
-      return W_SmallBits( nbits, (x & get_int_mask(nbits - shamt)) << shamt )
-
-    elif isinstance(w_other, W_IntObject):
-      shamt = w_other.intval
-      if shamt < 0 or shamt > get_int_mask(nbits):
-        raise oefmt(space.w_ValueError, "Integer %s is not a valid binop operand with Bits%d!\n"
-                                        "Suggestion: 0 <= x <= %s", hex(shamt), nbits, hex(get_int_mask(nbits)) )
-      if shamt >= nbits:  return W_SmallBits( nbits )
-      return W_SmallBits( nbits, (x & get_int_mask(nbits - shamt)) << shamt )
-
-    elif isinstance(w_other, W_BigBits):
-      raise oefmt(space.w_ValueError, "Operands of '<<' (lshift) operation must have matching bitwidth, "
-                                      "but here Bits%d != Bits%d.\n", nbits, w_other.nbits )
-
-    elif type(w_other) is W_LongObject:
-      big = w_other.num
-
-      if _rbigint_invalid_binop_operand( big, nbits ):
-        raise oefmt(space.w_ValueError, "Integer %s is not a valid binop operand with Bits%d!\n"
-                                        "Suggestion: 0 <= x <= %s", big.format(BASE16, prefix='0x'), nbits,
-                                        get_long_mask(nbits).format(BASE16, prefix='0x'))
-      shamt = big.digit(0)
-      if big.numdigits() == 1 and shamt <= nbits:
-        return W_SmallBits( nbits, (x & get_int_mask(nbits - shamt)) << shamt )
-      return W_SmallBits( nbits )
-
-    raise oefmt(space.w_TypeError, "Please do lshift between <Bits, Bits/int/long> objects" )
+    if shamt >= nbits:  return W_SmallBits( nbits )
+    # Keep the bits that survive the shift before shifting so nothing
+    # overflows, get_int_mask(nbits - shamt) is just mask >> shamt
+    return W_SmallBits( nbits, (self.intval & (get_int_mask(nbits) >> shamt)) << shamt )
 
   def descr_rlshift(self, space, w_other): # int << Bits, what is nbits??
     raise oefmt(space.w_TypeError, "rlshift not implemented" )
@@ -791,12 +680,10 @@ class W_SmallBits(W_AbstractBits):
     return wrapint( space, self.intval )
 
   def descr_int(self, space): # TODO
-    index = self.nbits - 1
-    intval = self.intval
-    msb = (intval >> index) & 1
-    # if not msb: return wrapint( space, intval )
-    # return wrapint( space, intval - get_int_mask(self.nbits) - 1 )
-    return wrapint( space, intval - msb*get_int_mask(self.nbits) - msb )
+    # Branchless sign extension: flipping the msb and subtracting its
+    # weight maps [0, 2**n) onto [-2**(n-1), 2**(n-1)) without overflow
+    signbit = 1 << (jit.promote( self.nbits ) - 1)
+    return wrapint( space, (self.intval ^ signbit) - signbit )
 
   descr_pos = func_with_new_name( descr_uint, 'descr_pos' )
   descr_index = func_with_new_name( descr_uint, 'descr_index' )
@@ -809,21 +696,14 @@ class W_SmallBits(W_AbstractBits):
     return space.newbool( self.intval != 0 )
 
   def descr_invert(self, space):
-    return W_SmallBits( self.nbits, get_int_mask(self.nbits) - self.intval )
+    nbits = jit.promote( self.nbits )
+    return W_SmallBits( nbits, get_int_mask(nbits) - self.intval )
 
   # def descr_neg(self, space):
 
   def descr_hash(self, space):
-    hash_nbits = _hash_int( self.nbits )
-    hash_value = _hash_int( self.intval )
-
-    # Manually implement a single iter of W_TupleObject.descr_hash
-
-    x = 0x345678
-    x = (x ^ hash_nbits) * 1000003
-    x = (x ^ hash_value) * (1000003+82520+1+1)
-    x += 97531
-    return space.newint( intmask(x) )
+    nbits = jit.promote( self.nbits )
+    return space.newint( _hash_bits( nbits, _hash_int( self.intval ) ) )
 
   # PyMTL specific
   #        |
@@ -984,16 +864,19 @@ class W_SmallBits(W_AbstractBits):
     w_data = space.newtext( (rbigint.fromint(self.intval)).format(BASE2) )
     return space.newtext("0b").descr_add( space, w_data.descr_zfill(space, self.nbits) )
 
+  # intval is never negative, so plain %o/%x formatting is enough and
+  # we don't need to allocate an rbigint just to format it
+
   def descr_oct(self, space):
-    w_data = space.newtext( (rbigint.fromint(self.intval)).format(BASE8) )
+    w_data = space.newtext( "%o" % self.intval )
     return space.newtext("0o").descr_add( space, w_data.descr_zfill(space, ((self.nbits-1)/3)+1) )
 
   def descr_hex(self, space):
-    w_data = space.newtext( (rbigint.fromint(self.intval)).format(BASE16) )
+    w_data = space.newtext( "%x" % self.intval )
     return space.newtext("0x").descr_add( space, w_data.descr_zfill(space, ((self.nbits-1)/4)+1) )
 
   def descr_str(self, space):
-    w_data = space.newtext( (rbigint.fromint(self.intval)).format(BASE16) )
+    w_data = space.newtext( "%x" % self.intval )
     return w_data.descr_zfill(space, ((self.nbits-1)/4)+1)
 
 #-----------------------------------------------------------------------
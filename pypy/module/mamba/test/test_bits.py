@@ -51,6 +51,9 @@ class AppTestBits:
         assert b[mamba.Bits(100, 0):2] == mamba.Bits(2, 0b10)
         assert b[0:mamba.Bits(300, 2)] == mamba.Bits(2, 0b10)
 
+        with raises(IndexError):
+            b[mamba.Bits(100, 1 << 70)]
+
         initval = 0b10110010 << 70 | 0b110101011
         b = mamba.Bits(80, initval)
         assert b[0:70] == mamba.Bits(70, 0b110101011)
@@ -117,6 +120,22 @@ class AppTestBits:
         with raises(ValueError):
             b[0:2] = mamba.Bits(10, 0)
 
+    def test_setslice_int_bounds(self):
+        import mamba
+        for nbits, lo, hi in [(8, 2, 5), (100, 3, 7), (100, 30, 93)]:
+            n = hi - lo
+            b = mamba.Bits(nbits, 0)
+            b[lo:hi] = 2 ** n - 1
+            assert b[lo:hi] == mamba.Bits(n, 2 ** n - 1)
+            b[lo:hi] = -2 ** (n - 1)
+            assert b[lo:hi] == mamba.Bits(n, 2 ** (n - 1))
+            b[lo:hi] = -1
+            assert b[lo:hi] == mamba.Bits(n, 2 ** n - 1)
+            with raises(ValueError):
+                b[lo:hi] = 2 ** n
+            with raises(ValueError):
+                b[lo:hi] = -2 ** (n - 1) - 1
+
     def test_bigbits_setslice(self):
         import mamba
         def make_long(x): return x + 2 ** 100 - 2 ** 100
@@ -182,6 +201,19 @@ class AppTestBits:
         with raises(ValueError):
             mamba.Bits(4, mamba.Bits(3, 2))
 
+    def test_bits_new_common_widths(self):
+        import mamba
+        for nbits in [1, 2, 3, 4, 8, 16, 32]:
+            assert mamba.Bits(nbits, 1).uint() == 1
+            assert mamba.Bits(nbits, -1).uint() == 2 ** nbits - 1
+            assert mamba.Bits(nbits, 2 ** nbits - 1).uint() == 2 ** nbits - 1
+            assert mamba.Bits(nbits, 2 ** nbits, True).uint() == 0
+            assert mamba.Bits(nbits, 2 ** nbits + 1, 1).uint() == 1
+            with raises(ValueError):
+                mamba.Bits(nbits, 2 ** nbits)
+            with raises(ValueError):
+                mamba.Bits(nbits, -2 ** (nbits - 1) - 1)
+
     def test_nbits(self):
         import mamba
         for i in range(1, 100):
@@ -225,6 +257,9 @@ class AppTestBits:
         assert b << mamba.Bits(10, 100) == 0
         assert b << mamba.Bits(10, 1) == 2
         assert b << mamba.Bits(10, 4) == 1 << 4
+        assert mamba.Bits(8, 0xff) << 4 == 0xf0
+        assert mamba.Bits(63, 2**63-1) << 62 == 2**62
+        assert mamba.Bits(63, 2**63-1) >> 62 == 1
 
         with raises(ValueError):
           b << 1024
@@ -314,6 +349,21 @@ class AppTestBits:
         b = mamba.Bits(80, 17)
         assert ~b == mamba.Bits(80, ~17)
 
+    def test_bits_int_sext(self):
+        import mamba
+        assert mamba.Bits(1, 1).int() == -1
+        assert mamba.Bits(8, 0x7f).int() == 127
+        assert mamba.Bits(8, 0x80).int() == -128
+        assert mamba.Bits(8, 0xff).int() == -1
+        assert mamba.Bits(63, 2**62).int() == -2**62
+        assert mamba.Bits(63, 2**62 - 1).int() == 2**62 - 1
+        assert mamba.Bits(64, 2**63).int() == -2**63
+        assert mamba.Bits(100, 2**99).int() == -2**99
+        assert mamba.Bits(100, 2**100 - 1).int() == -1
+        assert mamba.Bits(126, 2**125 + 5).int() == 5 - 2**125
+        assert mamba.Bits(127, 5).int() == 5
+        assert mamba.Bits(127, 2**64).int() == 2**64
+
     def test_mixed_cmp(self):
         import mamba
         def make_long(x): return x + 2 ** 100 - 2 ** 100
@@ -354,6 +404,11 @@ class AppTestBits:
                 assert a + b == b + a == 2
                 assert a & b == b & a == 1
         assert mamba.Bits(64,1) + int(mamba.Bits(64, 0xffffffffffffffff )) == 0
+        # overflow of the machine word wraps within the Bits width
+        big = 2 ** 63 - 1
+        assert mamba.Bits(63, big) + mamba.Bits(63, big) == mamba.Bits(63, big - 1)
+        assert mamba.Bits(63, big) * big == mamba.Bits(63, 1)
+        assert mamba.Bits(63, 2 ** 62 + 3) * mamba.Bits(63, 4) == mamba.Bits(63, 12)
 
         with raises(ValueError):
             mamba.Bits(10,1) + mamba.Bits(11,1)
@@ -388,6 +443,12 @@ class AppTestBits:
             x // -1
         with raises( ValueError ):
             x // 100000000000000000000000000
+        with raises( ZeroDivisionError ):
+            x // 0
+        with raises( ZeroDivisionError ):
+            x // (2 ** 100 - 2 ** 100) # long zero
+        with raises( ZeroDivisionError ):
+            x // mamba.Bits( 4, 0 )
 
         with raises( ValueError ):
           a = mamba.Bits(4,3) // mamba.Bits(3,1)
@@ -402,6 +463,12 @@ class AppTestBits:
         with raises( ValueError ):
             z = y // x
 
+        x = mamba.Bits(8, 0)
+        with raises( ZeroDivisionError ):
+            5 // x
+        with raises( ZeroDivisionError ):
+            (5 + 2 ** 100 - 2 ** 100) // x # long
+
         x = mamba.Bits(400, 3**100)
         y = 2**300
         z = y // x
@@ -425,6 +492,12 @@ class AppTestBits:
             x % -1
         with raises( ValueError ):
             x % 100000000000000000000000000
+        with raises( ZeroDivisionError ):
+            x % 0
+        with raises( ZeroDivisionError ):
+            x % (2 ** 100 - 2 ** 100) # long zero
+        with raises( ZeroDivisionError ):
+            x % mamba.Bits( 4, 0 )
 
         with raises( ValueError ):
           a = mamba.Bits(4,3) % mamba.Bits(3,1)
@@ -439,6 +512,12 @@ class AppTestBits:
         with raises( ValueError ):
             z = y % x
 
+        x = mamba.Bits(8, 0)
+        with raises( ZeroDivisionError ):
+            5 % x
+        with raises( ZeroDivisionError ):
+            (5 + 2 ** 100 - 2 ** 100) % x # long
+
     def test_bits_str(self):
         import mamba, sys
         b = mamba.Bits(8,42)
@@ -466,6 +545,18 @@ class AppTestBits:
         assert mamba.Bits(15,35).bin() == '0b000000000100011'
         assert mamba.Bits(15,35).oct() == '0o00043'
         assert mamba.Bits(15,35).hex() == '0x0023'
+        assert mamba.Bits(8,0).oct() == '0o000'
+        assert mamba.Bits(8,0).hex() == '0x00'
+        assert str(mamba.Bits(1,0)) == '0'
+        assert str(mamba.Bits(63,2**63-1)) == '7fffffffffffffff'
+
+    def test_bits_hash(self):
+        import mamba
+        # hash(Bits(n, v)) mixes like hash((n, v))
+        assert hash(mamba.Bits(8, 5)) == hash((8, 5))
+        assert hash(mamba.Bits(100, 5)) == hash((100, 5))
+        assert hash(mamba.Bits(100, 1 << 80)) == hash((100, 1 << 80))
+        assert hash(mamba.Bits(8, 5)) != hash(mamba.Bits(9, 5))
 
     def test_ilshift_create_bits_with_next(self):
         import mamba, sys
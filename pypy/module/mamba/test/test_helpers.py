@@ -1,7 +1,9 @@
 from hypothesis import strategies, given, example, assume
-from rpython.rlib.rbigint     import rbigint, SHIFT, BASE8, BASE16
+from rpython.rlib.rbigint     import rbigint, SHIFT, BASE8, BASE16, NULLRBIGINT
 from pypy.module.mamba.helper_funcs import (setitem_long_long_helper,
-        _rbigint_rshift_maskoff, _rbigint_rshift_maskoff_retint, _rbigint_setidx)
+        setitem_long_int_helper,
+        _rbigint_rshift, _rbigint_rshift_maskoff, _rbigint_rshift_maskoff_retint,
+        _rbigint_lshift_maskoff, _rbigint_setidx)
 
 @strategies.composite
 def setitem_inputs(draw):
@@ -40,6 +42,42 @@ def test_setitem_long_long_helper(input):
     result = setitem_long_long_helper(value, other, start, stop)
     cmpbits(result, bits)
 
+@strategies.composite
+def setitem_int_inputs(draw):
+    # values that fit in one or two digits
+    nbits = draw(strategies.integers(SHIFT + 1, 2 * SHIFT))
+    value = rbigint.fromlong(draw(strategies.integers(min_value=0, max_value=(1<<nbits)-1)))
+    start = draw(strategies.integers(0, nbits - 1))
+    stop = draw(strategies.integers(start + 1, min(nbits, start + SHIFT)))
+    other = draw(strategies.integers(min_value=0, max_value=(1<<(stop - start)) - 1))
+    return nbits, value, other, start, stop
+
+@example((2 * SHIFT, rbigint.fromlong((1 << (2 * SHIFT)) - 1), 0, SHIFT - 1, SHIFT + 1))
+@example((2 * SHIFT, rbigint.fromlong(1 << SHIFT), 0, SHIFT, SHIFT + 1))
+@given(setitem_int_inputs())
+def test_setitem_long_int_helper(input):
+    nbits, value, other, start, stop = input
+
+    bits = bitify(nbits, value)
+    otherbits = bitify(stop - start, rbigint.fromint(other))
+    bits[start: stop] = otherbits
+    result = setitem_long_int_helper(value, other, start, stop)
+    cmpbits(result, bits)
+    assert result.numdigits() == 1 or result.digit(result.numdigits() - 1) != 0
+
+@example((130, rbigint.fromlong(1 << 129), NULLRBIGINT, 0, 129))
+@example((130, rbigint.fromlong(1 << 129), NULLRBIGINT, 1, 130))
+@example((200, rbigint.fromlong((1 << 200) - 1), NULLRBIGINT, SHIFT, 2 * SHIFT))
+@given(setitem_inputs())
+def test_setitem_long_int_helper_zero(input):
+    nbits, value, _, start, stop = input
+
+    bits = bitify(nbits, value)
+    bits[start: stop] = ['0'] * (stop - start)
+    result = setitem_long_int_helper(value, 0, start, stop)
+    cmpbits(result, bits)
+    assert result.numdigits() == 1 or result.digit(result.numdigits() - 1) != 0
+
 @strategies.composite
 def rshift_maskoff_inputs(draw):
     # only big bits for now
@@ -60,6 +98,48 @@ def test_rshift_maskoff(input):
         res = _rbigint_rshift_maskoff_retint(value, shamt, masklen)
         cmpbits(res, resbits)
 
+@strategies.composite
+def rshift_inputs(draw):
+    # only big bits for now
+    nbits = draw(strategies.integers(64, 1024))
+    value = rbigint.fromlong(draw(strategies.integers(min_value=0, max_value=(1<<nbits)-1)))
+    shamt = rbigint.fromlong(draw(strategies.integers(min_value=0, max_value=(1<<nbits)-1)))
+    return nbits, value, shamt
+
+@example((64, rbigint.fromlong((1 << 64) - 1), rbigint.fromlong(SHIFT)))
+@example((127, rbigint.fromlong((1 << 127) - 1), rbigint.fromlong(1)))
+@example((300, rbigint.fromlong((1 << 300) - 1), rbigint.fromlong(2 * SHIFT)))
+@example((100, rbigint.fromlong(1 << 99), rbigint.fromlong(99)))
+@example((100, rbigint.fromlong(1 << 70), rbigint.fromlong(71)))
+@given(rshift_inputs())
+def test_rshift(input):
+    nbits, value, shamt = input
+    bits = bitify(nbits, value)
+    resbits = bits[shamt.tolong():] + ['0'] * min(nbits, shamt.tolong())
+    res = _rbigint_rshift(value, shamt)
+    cmpbits(res, resbits)
+
+@strategies.composite
+def lshift_maskoff_inputs(draw):
+    # only big bits for now
+    nbits = draw(strategies.integers(64, 1024))
+    value = rbigint.fromlong(draw(strategies.integers(min_value=0, max_value=(1<<nbits)-1)))
+    shamt = draw(strategies.integers(0, nbits + 1))
+    return nbits, value, shamt
+
+@example((2 * SHIFT, rbigint.fromlong((1 << (2 * SHIFT)) - 1), SHIFT))
+@example((2 * SHIFT + 1, rbigint.fromlong((1 << (2 * SHIFT + 1)) - 1), 1))
+@example((100, rbigint.fromlong(5), 3))
+@example((100, rbigint.fromlong(1 << (SHIFT - 1)), 1))
+@example((100, rbigint.fromlong(1 << (SHIFT - 2)), 1))
+@given(lshift_maskoff_inputs())
+def test_lshift_maskoff(input):
+    nbits, value, shamt = input
+    bits = bitify(nbits, value)
+    resbits = (['0'] * shamt + bits)[:nbits]
+    res = _rbigint_lshift_maskoff(value, shamt, nbits)
+    cmpbits(res, resbits)
+
 @strategies.composite
 def setidx_inputs(draw):
     # only big bits for now
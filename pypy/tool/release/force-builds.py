@@ -57,7 +57,6 @@ def get_user():
 def main(options):
     #XXX: handle release tags
     #XXX: handle validity checks
-    lock = defer.DeferredLock()
     requests = []
     def ebList(err):
         if err.check(PageRedirect) is not None:
@@ -69,18 +68,20 @@ def main(options):
     else:
         builders = RPYTHON_BUILDERS + OWN_BUILDERS + JIT_BUILDERS
 
+    # the query is the same for every builder, build it once
+    args = [
+        ('username', options.user),
+        ('revision', ''),
+        ('forcescheduler', 'Force Build'),
+        ('branch', options.branch),
+        ('reason', options.reason)]
+    query = '&'.join([k + '=' + quote(v) for (k, v) in args])
+
     for builder in builders:
         print('Forcing', builder, '...')
-        url = "http://" + options.server + "/builders/" + builder + "/force"
-        args = [
-            ('username', options.user),
-            ('revision', ''),
-            ('forcescheduler', 'Force Build'),
-            ('branch', options.branch),
-            ('reason', options.reason)]
-        url = url + '?' + '&'.join([k + '=' + quote(v) for (k, v) in args])
+        url = "http://" + options.server + "/builders/" + builder + "/force?" + query
         requests.append(
-            lock.run(client.getPage, url.encode('utf-8'), followRedirect=False).addErrback(ebList))
+            client.getPage(url.encode('utf-8'), followRedirect=False).addErrback(ebList))
 
     d = defer.gatherResults(requests)
     d.addErrback(log.err)